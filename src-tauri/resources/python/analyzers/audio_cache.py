@@ -0,0 +1,74 @@
+"""Decoded audio and derived features shared between analyzers."""
+
+import threading
+
+
+class AudioCache:
+    """Decoded audio and derived features shared by the analyzers of one run.
+
+    Each entry is computed once. Concurrent requests for the same entry wait
+    for the first computation rather than repeating it. Audio is decoded once
+    per file at DECODE_SR; lower rates are resampled from that decode instead
+    of decoding the file again. Samples are float32 mono, as librosa returns
+    them.
+    """
+
+    DECODE_SR = 22050
+
+    # Onset envelope shared by low-level features and mood: half the decode
+    # rate with half the default hop, so frames still line up with
+    # DECODE_SR / 512. Pass these to onset_strength() to hit the shared entry.
+    ONSET_SR = DECODE_SR // 2
+    ONSET_HOP = 256
+    ONSET_N_FFT = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry_locks = {}
+        self._entries = {}
+
+    def _memoize(self, key: tuple, compute):
+        with self._lock:
+            entry_lock = self._entry_locks.setdefault(key, threading.Lock())
+        with entry_lock:
+            if key not in self._entries:
+                self._entries[key] = compute()
+            return self._entries[key]
+
+    def get(self, path: str, sr: int):
+        """Return `(y, sr)` for `path` at sample rate `sr`."""
+        import librosa
+
+        def compute():
+            if sr < self.DECODE_SR:
+                y, src_sr = self.get(path, self.DECODE_SR)
+                return librosa.resample(y, orig_sr=src_sr, target_sr=sr), sr
+            return librosa.load(path, sr=sr)
+
+        return self._memoize(("audio", str(path), sr), compute)
+
+    def onset_strength(
+        self, path: str, sr: int, hop_length: int = 512, n_fft: int = 2048
+    ):
+        """Return the librosa onset strength envelope of `path` at `sr`."""
+        import librosa
+
+        def compute():
+            y, _ = self.get(path, sr)
+            return librosa.onset.onset_strength(
+                y=y, sr=sr, n_fft=n_fft, hop_length=hop_length
+            )
+
+        return self._memoize(
+            ("onset_strength", str(path), sr, hop_length, n_fft), compute
+        )
+
+    def chroma_cqt(self, path: str, sr: int, hop_length: int = 512):
+        """Return the librosa constant-Q chromagram (12 x T) of `path` at `sr`."""
+        import librosa
+
+        def compute():
+            y, _ = self.get(path, sr)
+            return librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
+
+        return self._memoize(("chroma_cqt", str(path), sr, hop_length), compute)
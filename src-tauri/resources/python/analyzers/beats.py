@@ -1,46 +1,98 @@
 """Beat and tempo analysis using madmom."""
 
+import contextlib
 import logging
+import os
 
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Cap on madmom's num_threads, which is a number of worker processes (one
+# multiprocessing.Pool per RNN processor), not threads. More than this
+# oversubscribes the cores shared with the other analyzers running
+# concurrently in the pipeline.
+MAX_NN_THREADS = 4
 
-def analyze_beats(audio_path: str, **kwargs) -> dict:
+
+def _close_pools(processor):
+    """Close the multiprocessing pools madmom created inside `processor`.
+
+    madmom's ParallelProcessor keeps only its pool's bound `map`, and never
+    closes the pool, so its worker processes would outlive the analysis.
+    """
+    from multiprocessing.pool import Pool
+
+    from madmom.processors import ParallelProcessor
+
+    stack = [processor]
+    while stack:
+        proc = stack.pop()
+        if isinstance(proc, ParallelProcessor):
+            pool = getattr(proc.map, "__self__", None)
+            if isinstance(pool, Pool):
+                pool.close()
+                pool.join()
+        stack.extend(getattr(proc, "processors", ()))
+
+
+@contextlib.contextmanager
+def _rnn_processor(processor_cls, num_threads: int):
+    """Build a madmom RNN processor for one analysis, closing its pools after."""
+    processor = processor_cls(num_threads=num_threads)
+    try:
+        yield processor
+    finally:
+        _close_pools(processor)
+
+
+def analyze_beats(audio_path: str, num_threads: int = None, **kwargs) -> dict:
     """Detect beats, downbeats, tempo, and time signature.
 
+    `num_threads` is how many worker processes madmom's RNN ensembles use.
+    It defaults to this process-pool worker's share of the cores
+    (VIBELIGHTS_WORKER_CPUS), or half the cores outside the pool, capped at
+    MAX_NN_THREADS.
+
     Returns a dict matching the BeatAnalysis Rust struct.
     """
     import madmom
 
     logger.info("Running beat analysis on %s", audio_path)
 
+    if num_threads is None:
+        cpu_share = int(os.environ.get("VIBELIGHTS_WORKER_CPUS", 0))
+        num_threads = cpu_share or (os.cpu_count() or 2) // 2
+        num_threads = min(MAX_NN_THREADS, max(1, num_threads))
+
     # Beat detection using RNNBeatProcessor + DBNBeatTrackingProcessor
-    proc = madmom.features.beats.RNNBeatProcessor()(audio_path)
+    with _rnn_processor(
+        madmom.features.beats.RNNBeatProcessor, num_threads
+    ) as rnn_beats:
+        proc = rnn_beats(audio_path)
     beat_proc = madmom.features.beats.DBNBeatTrackingProcessor(fps=100)
     beats = beat_proc(proc)
 
     # Downbeat detection
     try:
-        down_proc = madmom.features.downbeats.RNNDownBeatProcessor()(audio_path)
+        with _rnn_processor(
+            madmom.features.downbeats.RNNDownBeatProcessor, num_threads
+        ) as rnn_downbeats:
+            down_proc = rnn_downbeats(audio_path)
         dbn_down = madmom.features.downbeats.DBNDownBeatTrackingProcessor(
             beats_per_bar=[3, 4], fps=100
         )
         downbeat_result = dbn_down(down_proc)
         # downbeat_result is (time, beat_position) — downbeats have position 1
-        downbeats = [
-            float(row[0]) for row in downbeat_result if int(row[1]) == 1
-        ]
-        # Infer time signature from most common beats-per-bar
+        downbeat_result = np.asarray(downbeat_result, dtype=float).reshape(-1, 2)
+        is_downbeat = downbeat_result[:, 1].astype(int) == 1
+        downbeats = downbeat_result[is_downbeat, 0].tolist()
+        # Infer time signature from most common beats-per-bar. Beats are
+        # sorted, so the beats in each bar are a contiguous index range.
         if len(downbeats) >= 2:
-            bar_lengths = []
-            for i in range(len(downbeats) - 1):
-                count = sum(
-                    1 for b in beats if downbeats[i] <= b < downbeats[i + 1]
-                )
-                bar_lengths.append(count)
-            time_signature = int(np.median(bar_lengths)) if bar_lengths else 4
+            bar_bounds = np.searchsorted(beats, downbeats, side="left")
+            bar_lengths = np.diff(bar_bounds)
+            time_signature = int(np.median(bar_lengths))
         else:
             time_signature = 4
     except Exception:
@@ -63,21 +115,19 @@ def analyze_beats(audio_path: str, **kwargs) -> dict:
         tempo = 120.0
         tempo_confidence = 0.0
 
-    # Beat confidences from the activation function
-    beat_confidences = []
-    for beat_time in beats:
-        # Find nearest activation value
-        idx = int(beat_time * 100)
-        if 0 <= idx < len(proc):
-            beat_confidences.append(float(proc[idx]))
-        else:
-            beat_confidences.append(0.5)
+    # Beat confidences from the activation function (100 fps); beats that
+    # fall outside the activation get a neutral 0.5
+    beats = np.asarray(beats, dtype=float)
+    idx = (beats * 100).astype(np.int64)
+    in_range = (idx >= 0) & (idx < len(proc))
+    beat_confidences = np.full(len(beats), 0.5)
+    beat_confidences[in_range] = proc[idx[in_range]]
 
     return {
-        "beats": [float(b) for b in beats],
+        "beats": beats.tolist(),
         "downbeats": downbeats,
         "tempo": tempo,
         "time_signature": time_signature,
-        "beat_confidences": beat_confidences,
+        "beat_confidences": beat_confidences.tolist(),
         "tempo_confidence": tempo_confidence,
     }
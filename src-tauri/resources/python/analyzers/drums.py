@@ -2,10 +2,12 @@
 
 import logging
 
+from analyzers.audio_cache import AudioCache
+
 logger = logging.getLogger(__name__)
 
 
-def analyze_drums(drum_stem_path: str, **kwargs) -> dict:
+def analyze_drums(drum_stem_path: str, audio_cache=None, **kwargs) -> dict:
     """Detect onset times and strengths from the drum stem.
 
     Returns a dict matching the DrumAnalysis Rust struct.
@@ -15,25 +17,28 @@ def analyze_drums(drum_stem_path: str, **kwargs) -> dict:
 
     logger.info("Running drum onset detection on %s", drum_stem_path)
 
-    y, sr = librosa.load(drum_stem_path, sr=22050)
+    if audio_cache is None:
+        audio_cache = AudioCache()
+    y, sr = audio_cache.get(drum_stem_path, 22050)
 
     # Onset detection
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    onset_env = audio_cache.onset_strength(drum_stem_path, sr)
     onset_frames = librosa.onset.onset_detect(
         y=y, sr=sr, onset_envelope=onset_env, backtrack=False
     )
     onset_times = librosa.frames_to_time(onset_frames, sr=sr)
 
-    # Get strengths at onset positions
-    strengths = []
-    max_env = float(np.max(onset_env)) if len(onset_env) > 0 else 1.0
-    for frame in onset_frames:
-        if frame < len(onset_env):
-            strengths.append(round(float(onset_env[frame]) / max_env, 3))
-        else:
-            strengths.append(0.5)
+    # Get strengths at onset positions, normalized to the envelope peak;
+    # onsets past the end of the envelope get a neutral 0.5. An all-zero
+    # envelope (silence) divides by 1 so no NaN reaches the JSON
+    max_env = (float(np.max(onset_env)) if len(onset_env) > 0 else 0.0) or 1.0
+    onset_frames = np.asarray(onset_frames, dtype=np.int64)
+    valid = onset_frames < len(onset_env)
+    strengths = np.full(len(onset_frames), 0.5)
+    peaks = onset_env[onset_frames[valid]].astype(np.float64)
+    strengths[valid] = np.round(peaks / max_env, 3)
 
     return {
-        "onsets": [round(float(t), 4) for t in onset_times],
-        "strengths": strengths,
+        "onsets": np.round(onset_times, 4).tolist(),
+        "strengths": strengths.tolist(),
     }
@@ -4,10 +4,12 @@ import logging
 
 import numpy as np
 
+from analyzers.audio_cache import AudioCache
+
 logger = logging.getLogger(__name__)
 
 
-def analyze_features(audio_path: str, **kwargs) -> dict:
+def analyze_features(audio_path: str, audio_cache=None, **kwargs) -> dict:
     """Extract RMS, spectral centroid, onset strength, and chromagram.
 
     Returns a dict matching the LowLevelFeatures Rust struct.
@@ -16,28 +18,44 @@ def analyze_features(audio_path: str, **kwargs) -> dict:
 
     logger.info("Running low-level feature extraction on %s", audio_path)
 
-    y, sr = librosa.load(audio_path, sr=22050)
+    if audio_cache is None:
+        audio_cache = AudioCache()
+    y, sr = audio_cache.get(audio_path, 22050)
     hop_length = 512
 
+    # RMS and onset strength are per-frame summaries that don't need the full
+    # bandwidth: compute them on AudioCache's low-rate onset grid (same frames)
+    sr_low = AudioCache.ONSET_SR
+    hop_low = AudioCache.ONSET_HOP
+    y_low, _ = audio_cache.get(audio_path, sr_low)
+
     # RMS energy
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+    rms = librosa.feature.rms(y=y_low, frame_length=1024, hop_length=hop_low)[0]
 
-    # Spectral centroid
+    # Spectral centroid (full bandwidth, since it is measured in Hz)
     centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0]
 
-    # Onset strength
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+    # Onset strength (shared with mood's tempo estimate)
+    onset_env = audio_cache.onset_strength(
+        audio_path, sr_low, hop_length=hop_low, n_fft=AudioCache.ONSET_N_FFT
+    )
+
+    # Chromagram (12 x T, shared with chord detection)
+    chroma = audio_cache.chroma_cqt(audio_path, sr, hop_length=hop_length)
 
-    # Chromagram (12 x T)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
+    # Frame counts can differ by one after resampling; every series (and the
+    # chromagram) shares one time axis
+    n_frames = min(len(rms), len(centroid), len(onset_env), chroma.shape[1])
+    rms, centroid, onset_env = rms[:n_frames], centroid[:n_frames], onset_env[:n_frames]
+    chroma = chroma[:, :n_frames]
 
     time_step = hop_length / sr
 
     return {
-        "rms": [round(float(x), 6) for x in rms],
-        "spectral_centroid": [round(float(x), 2) for x in centroid],
-        "onset_strength": [round(float(x), 6) for x in onset_env],
+        "rms": np.round(rms.astype(np.float64), 6).tolist(),
+        "spectral_centroid": np.round(centroid.astype(np.float64), 2).tolist(),
+        "onset_strength": np.round(onset_env.astype(np.float64), 6).tolist(),
         "time_step": round(time_step, 8),
-        "chromagram": [round(float(x), 4) for x in chroma.flatten("C")],
+        "chromagram": np.round(chroma.astype(np.float64).ravel("C"), 4).tolist(),
         "chromagram_length": int(chroma.shape[1]),
     }
@@ -1,57 +1,101 @@
 """Key detection and chord recognition."""
 
+import functools
 import logging
+import threading
+
+import numpy as np
+
+from analyzers.audio_cache import AudioCache
 
 logger = logging.getLogger(__name__)
 
+_PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
-def analyze_harmony(audio_path: str, **kwargs) -> dict:
-    """Detect musical key and chord progression.
+# Simple chord templates (major and minor triads) rooted at C
+_MAJOR_TEMPLATE = np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0], dtype=float)
+_MINOR_TEMPLATE = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0], dtype=float)
 
-    Returns a dict matching the HarmonyAnalysis Rust struct.
-    """
-    logger.info("Running harmony analysis on %s", audio_path)
+# All 24 triads as rows (24 x 12), ordered C maj, C min, C# maj, ... so that
+# argmax breaks ties the same way as scanning roots in order
+_CHORD_TEMPLATES = np.stack(
+    [
+        np.roll(template, root)
+        for root in range(12)
+        for template in (_MAJOR_TEMPLATE, _MINOR_TEMPLATE)
+    ]
+)
+_CHORD_LABELS = [
+    f"{name}{quality}" for name in _PITCH_CLASSES for quality in ("maj", "m")
+]
+
+# Essentia algorithm instances keep internal state and are not thread-safe
+_key_extractor_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _essentia():
+    """Return `essentia.standard`, or None if essentia is not installed.
 
+    Cached, so the import is only attempted once per process.
+    """
     try:
         import essentia.standard as es
+    except ImportError:
+        logger.info("Essentia not available, using librosa for key detection")
+        return None
+    return es
+
+
+@functools.lru_cache(maxsize=1)
+def _key_extractor():
+    """Return the shared essentia KeyExtractor.
+
+    Construction errors propagate and are not cached, so a failed build is
+    retried on the next call.
+    """
+    return _essentia().KeyExtractor()
 
-        audio = es.MonoLoader(filename=audio_path, sampleRate=44100)()
 
-        # Key detection
-        key_extractor = es.KeyExtractor()
-        key, scale, key_strength = key_extractor(audio)
-        key_str = f"{key} {scale}"
-        key_confidence = float(key_strength)
+def analyze_harmony(audio_path: str, audio_cache=None, **kwargs) -> dict:
+    """Detect musical key and chord progression.
+
+    Returns a dict matching the HarmonyAnalysis Rust struct.
+    """
+    logger.info("Running harmony analysis on %s", audio_path)
+
+    if audio_cache is None:
+        audio_cache = AudioCache()
 
-    except (ImportError, Exception):
-        logger.info("Using librosa fallback for key detection")
+    key_str = None
+    try:
+        es = _essentia()
+        if es is not None:
+            key_extractor = _key_extractor()
+            audio = es.MonoLoader(filename=audio_path, sampleRate=44100)()
+            with _key_extractor_lock:
+                key, scale, key_strength = key_extractor(audio)
+            key_str = f"{key} {scale}"
+            key_confidence = float(key_strength)
+    except Exception as e:
+        # Broken essentia builds fail at import, construction or call time
+        logger.warning("Essentia key detection failed (%s), using librosa", e)
+
+    if key_str is None:
         import librosa
-        import numpy as np
 
-        y, sr = librosa.load(audio_path, sr=22050)
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
+        # Only the time-averaged chroma is used, so a coarse STFT chroma on
+        # band-limited audio is enough (and much cheaper than CQT)
+        y, sr = audio_cache.get(audio_path, 11025)
+        chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_fft=2048, hop_length=1024)
         chroma_avg = np.mean(chroma, axis=1)
 
-        key_names = [
-            "C",
-            "C#",
-            "D",
-            "D#",
-            "E",
-            "F",
-            "F#",
-            "G",
-            "G#",
-            "A",
-            "A#",
-            "B",
-        ]
         key_idx = int(np.argmax(chroma_avg))
-        key_str = f"{key_names[key_idx]} major"
+        key_str = f"{_PITCH_CLASSES[key_idx]} major"
         key_confidence = float(chroma_avg[key_idx] / np.sum(chroma_avg))
 
     # Chord detection using librosa chroma
-    chords = _detect_chords(audio_path)
+    chords = _detect_chords(audio_path, audio_cache)
 
     return {
         "key": key_str,
@@ -60,70 +104,45 @@ def analyze_harmony(audio_path: str, **kwargs) -> dict:
     }
 
 
-def _detect_chords(audio_path: str) -> list:
+def _detect_chords(audio_path: str, audio_cache) -> list:
     """Simple chord detection based on chroma features."""
-    import librosa
-    import numpy as np
-
-    y, sr = librosa.load(audio_path, sr=22050)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-
+    sr = 22050
     hop_length = 512
     frame_duration = hop_length / sr
 
-    # Simple chord templates (major and minor triads)
-    chord_names = [
-        "C",
-        "C#",
-        "D",
-        "D#",
-        "E",
-        "F",
-        "F#",
-        "G",
-        "G#",
-        "A",
-        "A#",
-        "B",
-    ]
-
-    major_template = np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0], dtype=float)
-    minor_template = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0], dtype=float)
-
-    chords = []
-    prev_chord = None
-    chord_start = 0.0
+    # Same chromagram as the low-level features, so it is computed once
+    chroma = audio_cache.chroma_cqt(audio_path, sr, hop_length=hop_length)
 
     # Process in chunks for efficiency
     chunk_size = 8  # ~0.19 seconds per chord
     n_frames = chroma.shape[1]
+    if n_frames == 0:
+        return []
+
+    # Mean chroma per chunk as columns (12 x n_chunks); the last may be partial
+    n_full = n_frames // chunk_size
+    chunk_matrix = (
+        chroma[:, : n_full * chunk_size].reshape(12, n_full, chunk_size).mean(axis=2)
+    )
+    if n_frames % chunk_size:
+        tail = chroma[:, n_full * chunk_size :].mean(axis=1, keepdims=True)
+        chunk_matrix = np.hstack([chunk_matrix, tail])
+    chunk_matrix /= np.linalg.norm(chunk_matrix, axis=0, keepdims=True) + 1e-10
+
+    # Score every template against every chunk in one product (24 x n_chunks)
+    scores = _CHORD_TEMPLATES @ chunk_matrix
+    best = scores.argmax(axis=0)
+    best_scores = scores.max(axis=0)
 
-    for i in range(0, n_frames, chunk_size):
-        end_idx = min(i + chunk_size, n_frames)
-        chunk = np.mean(chroma[:, i:end_idx], axis=1)
-        chunk = chunk / (np.linalg.norm(chunk) + 1e-10)
-
-        best_score = -1
-        best_chord = "N"
-
-        for root in range(12):
-            rolled_major = np.roll(major_template, root)
-            rolled_minor = np.roll(minor_template, root)
-
-            score_maj = float(np.dot(chunk, rolled_major))
-            score_min = float(np.dot(chunk, rolled_minor))
-
-            if score_maj > best_score:
-                best_score = score_maj
-                best_chord = f"{chord_names[root]}maj"
-            if score_min > best_score:
-                best_score = score_min
-                best_chord = f"{chord_names[root]}m"
-
-        if best_score < 0.5:
-            best_chord = "N"
+    chords = []
+    prev_chord = None
+    chord_start = 0.0
 
-        current_time = i * frame_duration
+    for chunk_idx, (label_idx, best_score) in enumerate(
+        zip(best.tolist(), best_scores.tolist())
+    ):
+        best_chord = _CHORD_LABELS[label_idx] if best_score >= 0.5 else "N"
+        current_time = chunk_idx * chunk_size * frame_duration
 
         if best_chord != prev_chord:
             if prev_chord is not None:
@@ -1,26 +1,101 @@
 """Lyrics transcription using faster-whisper on the vocal stem."""
 
+import functools
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
-def analyze_lyrics(vocal_stem_path: str, use_gpu: bool = False, **kwargs) -> dict:
-    """Transcribe lyrics with word-level timestamps.
+def _cpu_threads() -> int:
+    """Thread budget for CTranslate2: every core unless OMP_NUM_THREADS is set.
 
-    Returns a dict matching the LyricsAnalysis Rust struct.
+    0 defers to CTranslate2, which reads OMP_NUM_THREADS itself, for values
+    that are not a plain integer (e.g. "" or a nested "4,2").
     """
+    value = os.environ.get("OMP_NUM_THREADS")
+    if value is None:
+        return os.cpu_count() or 0
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+def _load_model(device: str, compute_type: str):
+    """Load the Whisper model for `device` and `compute_type`."""
     from faster_whisper import WhisperModel
 
+    logger.info("Loading Whisper model (%s, %s)", device, compute_type)
+    return WhisperModel(
+        "turbo",
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=_cpu_threads(),
+        num_workers=1,
+    )
+
+
+def _word_dicts(segment_words) -> list:
+    """Build word dicts for one segment, rounding each column in one pass."""
+    import numpy as np
+
+    texts = [word.word.strip() for word in segment_words]
+    starts = np.round([word.start for word in segment_words], 4)
+    ends = np.round([word.end for word in segment_words], 4)
+    probs = np.round([word.probability for word in segment_words], 3)
+
+    return [
+        {"word": text, "start": start, "end": end, "confidence": prob}
+        for text, start, end, prob in zip(
+            texts, starts.tolist(), ends.tolist(), probs.tolist()
+        )
+    ]
+
+
+def analyze_lyrics(
+    vocal_stem_path: str,
+    use_gpu: bool = False,
+    beam_size: int = 1,
+    vad_filter: bool = True,
+    get_model=None,
+    on_words=None,
+    **kwargs,
+) -> dict:
+    """Transcribe lyrics with word-level timestamps.
+
+    Greedy decoding (`beam_size=1`) and voice-activity filtering skip most
+    of the decoder work on instrumental passages; raise `beam_size` or
+    disable `vad_filter` to trade speed for accuracy.
+
+    `get_model(key, loader)` (e.g. ModelCache.get) lets the caller keep the
+    Whisper model loaded between calls; without it the model is loaded here.
+
+    faster-whisper decodes lazily as segments are consumed. If `on_words` is
+    given it is called with each segment's word dicts as soon as that segment
+    is transcribed, so callers can stream lyrics before the whole file is done.
+
+    Returns a dict matching the LyricsAnalysis Rust struct.
+    """
     logger.info("Running lyrics transcription on %s", vocal_stem_path)
 
     device = "cuda" if use_gpu else "cpu"
     compute_type = "float16" if use_gpu else "int8"
 
-    model = WhisperModel("turbo", device=device, compute_type=compute_type)
+    loader = functools.partial(_load_model, device, compute_type)
+    if get_model is None:
+        model = loader()
+    else:
+        model = get_model(("whisper", device, compute_type), loader)
 
     segments, info = model.transcribe(
-        vocal_stem_path, word_timestamps=True, language=None
+        vocal_stem_path,
+        word_timestamps=True,
+        language=None,
+        beam_size=beam_size,
+        vad_filter=vad_filter,
+        vad_parameters={"min_silence_duration_ms": 500},
+        condition_on_previous_text=False,
     )
 
     words = []
@@ -29,15 +104,10 @@ def analyze_lyrics(vocal_stem_path: str, use_gpu: bool = False, **kwargs) -> dic
     for segment in segments:
         full_text_parts.append(segment.text)
         if segment.words:
-            for word in segment.words:
-                words.append(
-                    {
-                        "word": word.word.strip(),
-                        "start": float(word.start),
-                        "end": float(word.end),
-                        "confidence": float(word.probability),
-                    }
-                )
+            segment_words = _word_dicts(segment.words)
+            words.extend(segment_words)
+            if on_words is not None:
+                on_words(segment_words)
 
     return {
         "words": words,
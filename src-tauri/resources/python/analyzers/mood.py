@@ -1,66 +1,61 @@
-"""Mood, energy, and genre classification using Essentia TensorFlow models."""
+"""Mood and energy estimation from librosa audio descriptors."""
 
 import logging
 
+from analyzers.audio_cache import AudioCache
+
 logger = logging.getLogger(__name__)
 
 
-def analyze_mood(audio_path: str, **kwargs) -> dict:
-    """Classify mood (valence/arousal), danceability, and genre.
+def analyze_mood(audio_path: str, audio_cache=None, **kwargs) -> dict:
+    """Estimate mood (valence/arousal) and danceability.
+
+    Uses heuristics over spectral centroid, RMS energy and tempo; genre
+    classification is not available, so `genres` is always empty.
 
     Returns a dict matching the MoodAnalysis Rust struct.
     """
-    logger.info("Running mood analysis on %s", audio_path)
-
-    try:
-        import essentia.standard as es
-        from essentia.standard import (
-            MonoLoader,
-            TensorflowPredictMusiCNN,
-            TensorflowPredict2D,
-        )
-
-        audio = MonoLoader(filename=audio_path, sampleRate=16000)()
-
-        # Use MusiCNN embeddings for classification
-        embedding_model = TensorflowPredictMusiCNN(
-            graphFilename="", input="model/Placeholder", output="model/Sigmoid"
-        )
+    import librosa
+    import numpy as np
 
-        # Fallback to simpler feature extraction if TF models aren't available
-        raise ImportError("Using fallback")
-
-    except (ImportError, Exception):
-        logger.info("Using librosa fallback for mood analysis")
-        import librosa
-        import numpy as np
-
-        y, sr = librosa.load(audio_path, sr=22050)
-
-        # Approximate mood features from audio characteristics
-        # Spectral centroid correlates with brightness/energy
-        centroid = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        # RMS energy
-        rms = librosa.feature.rms(y=y)[0]
-        # Tempo
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        if hasattr(tempo, "__len__"):
-            tempo = float(tempo[0]) if len(tempo) > 0 else 120.0
-        else:
-            tempo = float(tempo)
-
-        # Rough heuristic mappings
-        mean_centroid = float(np.mean(centroid))
-        mean_rms = float(np.mean(rms))
-
-        # Normalize to 0-1 range with reasonable defaults
-        arousal = min(1.0, max(0.0, mean_rms * 5.0))
-        valence = min(1.0, max(0.0, (mean_centroid - 1000) / 4000))
-        danceability = min(1.0, max(0.0, (tempo - 60) / 120))
+    logger.info("Running mood analysis on %s", audio_path)
 
-        return {
-            "valence": round(valence, 3),
-            "arousal": round(arousal, 3),
-            "danceability": round(danceability, 3),
-            "genres": {},
-        }
+    if audio_cache is None:
+        audio_cache = AudioCache()
+    y, sr = audio_cache.get(audio_path, 22050)
+
+    # Approximate mood features from audio characteristics
+    # Spectral centroid correlates with brightness/energy
+    centroid = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
+    # RMS energy
+    rms = librosa.feature.rms(y=y)[0]
+    # Tempo (only the global estimate is needed, so skip beat tracking).
+    # Reuses the onset envelope from low-level feature extraction.
+    onset_env = audio_cache.onset_strength(
+        audio_path,
+        AudioCache.ONSET_SR,
+        hop_length=AudioCache.ONSET_HOP,
+        n_fft=AudioCache.ONSET_N_FFT,
+    )
+    tempo = librosa.feature.tempo(
+        onset_envelope=onset_env,
+        sr=AudioCache.ONSET_SR,
+        hop_length=AudioCache.ONSET_HOP,
+    )
+    tempo = float(tempo[0]) if len(tempo) > 0 else 120.0
+
+    # Rough heuristic mappings
+    mean_centroid = float(np.mean(centroid))
+    mean_rms = float(np.mean(rms))
+
+    # Normalize to 0-1 range with reasonable defaults
+    arousal = min(1.0, max(0.0, mean_rms * 5.0))
+    valence = min(1.0, max(0.0, (mean_centroid - 1000) / 4000))
+    danceability = min(1.0, max(0.0, (tempo - 60) / 120))
+
+    return {
+        "valence": round(valence, 3),
+        "arousal": round(arousal, 3),
+        "danceability": round(danceability, 3),
+        "genres": {},
+    }
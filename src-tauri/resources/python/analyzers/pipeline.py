@@ -6,38 +6,292 @@ Dependency graph:
   2. Beats (madmom) — independent
   3. Structure (allin1) — independent
   4. Lyrics (faster-whisper on vocal stem) — depends on stems
-  5. Mood (Essentia) — independent
+  5. Mood (librosa) — independent
   6. Key/Chords (Essentia/madmom) — independent
   7. Low-level (librosa) — independent
   8. Pitch (Basic Pitch) — independent
   9. Drum onsets (librosa on drum stem) — depends on stems
   10. Vocal presence (energy on vocal stem) — depends on stems
 
+Stems run first; the independent features then run concurrently, followed by
+the stem-dependent features (also concurrently). Most analyzers run in worker
+threads and share decoded audio through AudioCache. Beats and pitch only need
+the file path and hold the GIL for much of their NN inference, so they run in
+the caller's persistent process pool instead, when one is provided.
+
 Each step yields SSE events for progress streaming.
 """
 
-import json
+import asyncio
+import collections
+import functools
+import importlib
 import logging
+import multiprocessing
+import os
+import sys
+import threading
 import traceback
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+
+import orjson
+
+from analyzers.audio_cache import AudioCache
 
 logger = logging.getLogger(__name__)
 
 
+def _dumps(payload) -> str:
+    """Serialize an SSE payload (numpy values allowed) to a JSON string."""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def warmup():
+    """Run the librosa routines the analyzers use on a short synthetic signal.
+
+    librosa compiles several of its kernels with numba on first use (onset
+    peak picking, tempo estimation, ...), which would otherwise stall the
+    first analysis. numba caches compiled kernels on disk (NUMBA_CACHE_DIR),
+    so later processes mostly load them instead of compiling again.
+    """
+    try:
+        import librosa
+        import numpy as np
+    except ImportError:
+        return
+
+    sr = AudioCache.DECODE_SR
+    # chroma_cqt's lowest octave is computed on heavily downsampled audio and
+    # warns that n_fft is too large below about 3 s of signal
+    y = np.random.default_rng(0).uniform(-0.5, 0.5, 3 * sr).astype(np.float32)
+    try:
+        librosa.resample(y, orig_sr=sr, target_sr=sr // 2)
+        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+        librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
+        librosa.feature.tempo(onset_envelope=onset_env, sr=sr)
+        librosa.feature.rms(y=y)
+        librosa.feature.spectral_centroid(y=y, sr=sr)
+        librosa.feature.chroma_stft(y=y, sr=sr)
+        librosa.feature.chroma_cqt(y=y, sr=sr)
+    except Exception as e:
+        logger.warning("Warmup failed: %s", e)
+        return
+    logger.info("Warmup finished")
+
+
+class ModelCache:
+    """Loaded models kept in memory across analysis runs.
+
+    `get(key, loader)` returns the model stored under `key`, calling
+    `loader()` on a miss. Concurrent misses for the same key load it once.
+    At most `max_models` are kept; the least recently used one is dropped
+    first.
+    """
+
+    def __init__(self, max_models: int = 2):
+        self.max_models = max_models
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._models = collections.OrderedDict()
+
+    def _lookup(self, key: tuple):
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+        return None
+
+    def get(self, key: tuple, loader):
+        model = self._lookup(key)
+        if model is not None:
+            return model
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            model = self._lookup(key)
+            if model is None:
+                model = loader()
+                with self._lock:
+                    self._models[key] = model
+                    while len(self._models) > self.max_models:
+                        evicted, _ = self._models.popitem(last=False)
+                        logger.info("Evicted model %s", evicted)
+            return model
+
+    def evict(self, name: str = None) -> list:
+        """Drop models whose key starts with `name` (all if None); return their keys."""
+        with self._lock:
+            keys = [key for key in self._models if name is None or key[0] == name]
+            for key in keys:
+                del self._models[key]
+        return keys
+
+
+class _Step(NamedTuple):
+    """A single analyzer invocation scheduled by the pipeline."""
+
+    key: str  # Key in the result dict
+    name: str  # Human-readable name for logging
+    phase: str  # Progress phase shown to the user
+    detail: str
+    func: str  # "<module>.<function>" within the analyzers package
+    kwargs: dict  # Must be picklable when in_process_pool is set
+    in_process_pool: bool = False
+
+
+# Thread pool sizes of BLAS, OpenMP and numba, read when those libraries load
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+)
+
+
+def _exit_with_parent():
+    multiprocessing.parent_process().join()
+    os._exit(0)
+
+
+def _init_worker(cpu_share: int):
+    """Process pool initializer: route analyzer logs to stderr and preload madmom.
+
+    `cpu_share` is this worker's share of the cores. It goes to madmom's own
+    worker processes (VIBELIGHTS_WORKER_CPUS, see beats.analyze_beats), so
+    BLAS, OpenMP and numba are kept to one thread here and in those children.
+    """
+    # Before madmom (and with it numpy) is imported below
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = "1"
+    os.environ["VIBELIGHTS_WORKER_CPUS"] = str(cpu_share)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(levelname)s] %(name)s: %(message)s",
+        stream=sys.stderr,
+    )
+    # Don't outlive the sidecar if it exits (or is killed) mid-analysis
+    threading.Thread(target=_exit_with_parent, daemon=True).start()
+    try:
+        import madmom  # noqa: F401
+    except ImportError:
+        pass
+
+
+def create_process_pool(
+    max_workers: int = None, cpu_budget: int = None
+) -> ProcessPoolExecutor:
+    """Create a process pool for the analyzers that run out of process.
+
+    Meant to be long-lived (the sidecar keeps one for its lifetime) so that
+    per-process model caches and imports are reused across runs. Workers are
+    spawned rather than forked because the sidecar is multi-threaded.
+
+    `cpu_budget` (all cores by default) is split evenly between the workers.
+    """
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    max_workers = max_workers or min(4, cpu_budget)
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(max(1, cpu_budget // max_workers),),
+    )
+
+
+# Worker threads for the analyzers that run in this process. Jobs are
+# submitted directly (rather than through asyncio.to_thread) so that their
+# futures can be tracked: cancelling the awaiting task doesn't stop a job
+# that has already started.
+_thread_pool = ThreadPoolExecutor(thread_name_prefix="analyzer")
+
+
+def _submit(executor, in_flight: set, func, **kwargs):
+    """Start `func(**kwargs)` on `executor`, adding its future to `in_flight`.
+
+    Returns an asyncio future for the result; cancelling it drops the job if
+    it hasn't started yet.
+    """
+    future = executor.submit(functools.partial(func, **kwargs))
+    in_flight.add(future)
+    return asyncio.wrap_future(future)
+
+
+async def _run_step(
+    step: _Step, in_flight: set, process_pool: ProcessPoolExecutor = None
+):
+    """Run one analyzer in a worker thread or process. Failures are logged."""
+    try:
+        module_name, func_name = step.func.rsplit(".", 1)
+        module = importlib.import_module(f"analyzers.{module_name}")
+        func = getattr(module, func_name)
+        if step.in_process_pool and process_pool is not None:
+            executor = process_pool
+        else:
+            executor = _thread_pool
+        value = await _submit(executor, in_flight, func, **step.kwargs)
+    except Exception as e:
+        logger.error("%s failed: %s\n%s", step.name, e, traceback.format_exc())
+        value = None
+    return step, value
+
+
+async def _run_concurrently(
+    steps: list,
+    events: asyncio.Queue,
+    in_flight: set,
+    process_pool: ProcessPoolExecutor = None,
+):
+    """Run steps concurrently, yielding (step, value) as each one finishes.
+
+    Analyzers may post (None, event) items to `events` while running; these
+    are yielded in arrival order, interleaved with the completions.
+    """
+
+    async def run(step):
+        events.put_nowait(await _run_step(step, in_flight, process_pool))
+
+    tasks = [asyncio.ensure_future(run(step)) for step in steps]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            step, value = await events.get()
+            if step is not None:
+                remaining -= 1
+            yield step, value
+    finally:
+        # Consumer went away early (e.g. client disconnect)
+        for task in tasks:
+            task.cancel()
+
+
 async def run_pipeline(
-    audio_path: Path,
-    output_dir: Path,
+    audio_path: str,
+    output_dir: str,
     features: dict,
-    models_dir: Path,
+    models_dir: str,
     use_gpu: bool = False,
+    get_model=None,
+    process_pool: ProcessPoolExecutor = None,
+    in_flight: set = None,
 ):
     """
-    Generator that yields SSE event dicts.
+    Generator that yields SSE events as (event, data) tuples, where data is
+    the already-encoded JSON payload.
     Progress events have {"phase": str, "progress": float, "detail": str|None}.
+    Lyrics are also streamed as "partial_lyrics" events ({"words": [...]})
+    while transcription is running.
     The final event is the complete AudioAnalysis JSON.
-    """
-    import asyncio
 
+    `get_model` is a ModelCache.get used by analyzers that load models in
+    this process; pass a long-lived cache to keep models warm across runs.
+    `process_pool` (see create_process_pool) runs the analyzers that benefit
+    from their own process; without it they run in threads like the rest.
+    Every analyzer job's concurrent.futures.Future is added to `in_flight`,
+    if given. Closing the generator early cancels the jobs that haven't
+    started, but running ones finish in the background; callers limiting
+    concurrency wait for these futures.
+    """
     result = {
         "features": features,
         "beats": None,
@@ -52,21 +306,36 @@ async def run_pipeline(
         "vocal_presence": None,
     }
 
-    audio_str = str(audio_path)
-    output_str = str(output_dir)
+    # Analyzers take plain string paths; Path objects are accepted too
+    audio_str = os.fspath(audio_path)
+    output_str = os.fspath(output_dir)
+    models_str = os.fspath(models_dir)
 
     total_features = sum(1 for v in features.values() if v)
     completed = 0
 
+    if in_flight is None:
+        in_flight = set()
+
+    # Several analyzers decode the same file; share the decoded audio
+    audio_cache = AudioCache()
+    if get_model is None:
+        get_model = ModelCache().get
+
+    # Events streamed from analyzer threads while they run
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def stream_lyrics(words: list):
+        event = ("partial_lyrics", _dumps({"words": words}))
+        loop.call_soon_threadsafe(events.put_nowait, (None, event))
+
     def progress_event(phase: str, detail: str = None):
         nonlocal completed
         pct = completed / max(total_features, 1)
-        return {
-            "event": "progress",
-            "data": json.dumps(
-                {"phase": phase, "progress": round(pct, 3), "detail": detail}
-            ),
-        }
+        return "progress", _dumps(
+            {"phase": phase, "progress": round(pct, 3), "detail": detail}
+        )
 
     # ── Phase 1: Stems (must run first if needed) ──────────────────
 
@@ -76,7 +345,9 @@ async def run_pipeline(
         try:
             from analyzers.stems import analyze_stems
 
-            stems_data = await asyncio.to_thread(
+            stems_data = await _submit(
+                _thread_pool,
+                in_flight,
                 analyze_stems,
                 audio_path=audio_str,
                 output_dir=output_str,
@@ -87,149 +358,159 @@ async def run_pipeline(
             logger.error("Stems analysis failed: %s\n%s", e, traceback.format_exc())
         completed += 1
 
-    # ── Phase 2: Independent features (can run in parallel in future) ──
+    # ── Phase 2: Independent features (run concurrently) ───────────
 
+    steps = []
     if features.get("beats", False):
-        yield progress_event("Beat detection (madmom)...", "Detecting beats and tempo")
-        try:
-            from analyzers.beats import analyze_beats
-
-            result["beats"] = await asyncio.to_thread(
-                analyze_beats, audio_path=audio_str
+        steps.append(
+            _Step(
+                key="beats",
+                name="Beat analysis",
+                phase="Beat detection (madmom)...",
+                detail="Detecting beats and tempo",
+                func="beats.analyze_beats",
+                kwargs={"audio_path": audio_str},
+                in_process_pool=True,
             )
-        except Exception as e:
-            logger.error("Beat analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
-
+        )
     if features.get("structure", False):
-        yield progress_event("Structure analysis (allin1)...", "Detecting song sections")
-        try:
-            from analyzers.structure import analyze_structure
-
-            result["structure"] = await asyncio.to_thread(
-                analyze_structure,
-                audio_path=audio_str,
-                models_dir=str(models_dir),
+        steps.append(
+            _Step(
+                key="structure",
+                name="Structure analysis",
+                phase="Structure analysis (allin1)...",
+                detail="Detecting song sections",
+                func="structure.analyze_structure",
+                kwargs={"audio_path": audio_str, "models_dir": models_str},
             )
-        except Exception as e:
-            logger.error("Structure analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
-
+        )
     if features.get("mood", False):
-        yield progress_event("Mood analysis...", "Classifying mood and energy")
-        try:
-            from analyzers.mood import analyze_mood
-
-            result["mood"] = await asyncio.to_thread(
-                analyze_mood, audio_path=audio_str
+        steps.append(
+            _Step(
+                key="mood",
+                name="Mood analysis",
+                phase="Mood analysis...",
+                detail="Classifying mood and energy",
+                func="mood.analyze_mood",
+                kwargs={"audio_path": audio_str, "audio_cache": audio_cache},
             )
-        except Exception as e:
-            logger.error("Mood analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
-
+        )
     if features.get("harmony", False):
-        yield progress_event("Harmony analysis...", "Detecting key and chords")
-        try:
-            from analyzers.harmony import analyze_harmony
-
-            result["harmony"] = await asyncio.to_thread(
-                analyze_harmony, audio_path=audio_str
+        steps.append(
+            _Step(
+                key="harmony",
+                name="Harmony analysis",
+                phase="Harmony analysis...",
+                detail="Detecting key and chords",
+                func="harmony.analyze_harmony",
+                kwargs={"audio_path": audio_str, "audio_cache": audio_cache},
             )
-        except Exception as e:
-            logger.error("Harmony analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
-
+        )
     if features.get("low_level", False):
-        yield progress_event("Feature extraction...", "Extracting audio features")
-        try:
-            from analyzers.features import analyze_features
-
-            result["low_level"] = await asyncio.to_thread(
-                analyze_features, audio_path=audio_str
+        steps.append(
+            _Step(
+                key="low_level",
+                name="Feature extraction",
+                phase="Feature extraction...",
+                detail="Extracting audio features",
+                func="features.analyze_features",
+                kwargs={"audio_path": audio_str, "audio_cache": audio_cache},
             )
-        except Exception as e:
-            logger.error("Feature extraction failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
-
+        )
     if features.get("pitch", False):
-        yield progress_event("Pitch detection (Basic Pitch)...", "Detecting notes")
-        try:
-            from analyzers.pitch import analyze_pitch
-
-            result["pitch"] = await asyncio.to_thread(
-                analyze_pitch, audio_path=audio_str
+        steps.append(
+            _Step(
+                key="pitch",
+                name="Pitch analysis",
+                phase="Pitch detection (Basic Pitch)...",
+                detail="Detecting notes",
+                func="pitch.analyze_pitch",
+                kwargs={"audio_path": audio_str},
+                in_process_pool=True,
             )
-        except Exception as e:
-            logger.error("Pitch analysis failed: %s\n%s", e, traceback.format_exc())
+        )
+
+    for step in steps:
+        yield progress_event(step.phase, step.detail)
+    async for step, value in _run_concurrently(
+        steps, events, in_flight, process_pool
+    ):
+        if step is None:
+            yield value
+            continue
+        result[step.key] = value
         completed += 1
+        yield progress_event(step.phase, "Done")
 
-    # ── Phase 3: Stem-dependent features ───────────────────────────
-
-    if features.get("lyrics", False) and stems_data and stems_data.get("vocals"):
-        yield progress_event("Lyrics transcription (Whisper)...", "Transcribing vocals")
-        try:
-            from analyzers.lyrics import analyze_lyrics
+    # ── Phase 3: Stem-dependent features (run concurrently) ────────
 
-            result["lyrics"] = await asyncio.to_thread(
-                analyze_lyrics,
-                vocal_stem_path=stems_data["vocals"],
-                use_gpu=use_gpu,
-            )
-        except Exception as e:
-            logger.error("Lyrics analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
-    elif features.get("lyrics", False):
+    steps = []
+    if features.get("lyrics", False):
         # Run on original audio if no stems
-        yield progress_event("Lyrics transcription (Whisper)...", "Transcribing audio")
-        try:
-            from analyzers.lyrics import analyze_lyrics
-
-            result["lyrics"] = await asyncio.to_thread(
-                analyze_lyrics,
-                vocal_stem_path=audio_str,
-                use_gpu=use_gpu,
+        has_vocals = bool(stems_data and stems_data.get("vocals"))
+        steps.append(
+            _Step(
+                key="lyrics",
+                name="Lyrics analysis",
+                phase="Lyrics transcription (Whisper)...",
+                detail="Transcribing vocals" if has_vocals else "Transcribing audio",
+                func="lyrics.analyze_lyrics",
+                kwargs={
+                    "vocal_stem_path": stems_data["vocals"] if has_vocals else audio_str,
+                    "use_gpu": use_gpu,
+                    "get_model": get_model,
+                    "on_words": stream_lyrics,
+                },
             )
-        except Exception as e:
-            logger.error("Lyrics analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
+        )
 
     if features.get("drums", False) and stems_data and stems_data.get("drums"):
-        yield progress_event("Drum onset detection...", "Detecting drum hits")
-        try:
-            from analyzers.drums import analyze_drums
-
-            result["drums"] = await asyncio.to_thread(
-                analyze_drums, drum_stem_path=stems_data["drums"]
+        steps.append(
+            _Step(
+                key="drums",
+                name="Drum analysis",
+                phase="Drum onset detection...",
+                detail="Detecting drum hits",
+                func="drums.analyze_drums",
+                kwargs={
+                    "drum_stem_path": stems_data["drums"],
+                    "audio_cache": audio_cache,
+                },
             )
-        except Exception as e:
-            logger.error("Drum analysis failed: %s\n%s", e, traceback.format_exc())
-        completed += 1
+        )
     elif features.get("drums", False):
         completed += 1
 
     if features.get("vocal_presence", False) and stems_data and stems_data.get("vocals"):
-        yield progress_event("Vocal presence detection...", "Detecting vocal regions")
-        try:
-            from analyzers.vocals import analyze_vocals
-
-            result["vocal_presence"] = await asyncio.to_thread(
-                analyze_vocals, vocal_stem_path=stems_data["vocals"]
-            )
-        except Exception as e:
-            logger.error(
-                "Vocal presence failed: %s\n%s", e, traceback.format_exc()
+        steps.append(
+            _Step(
+                key="vocal_presence",
+                name="Vocal presence",
+                phase="Vocal presence detection...",
+                detail="Detecting vocal regions",
+                func="vocals.analyze_vocals",
+                kwargs={"vocal_stem_path": stems_data["vocals"]},
             )
-        completed += 1
+        )
     elif features.get("vocal_presence", False):
         completed += 1
 
+    for step in steps:
+        yield progress_event(step.phase, step.detail)
+    async for step, value in _run_concurrently(
+        steps, events, in_flight, process_pool
+    ):
+        if step is None:
+            yield value
+            continue
+        result[step.key] = value
+        completed += 1
+        yield progress_event(step.phase, "Done")
+
     # ── Final result ───────────────────────────────────────────────
 
-    yield {
-        "event": "progress",
-        "data": json.dumps(
-            {"phase": "Complete", "progress": 1.0, "detail": "Analysis finished"}
-        ),
-    }
+    yield "progress", _dumps(
+        {"phase": "Complete", "progress": 1.0, "detail": "Analysis finished"}
+    )
 
-    yield {"event": "result", "data": json.dumps(result)}
+    yield "result", _dumps(result)
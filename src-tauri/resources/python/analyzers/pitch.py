@@ -1,34 +1,58 @@
 """Polyphonic pitch detection using Basic Pitch."""
 
+import functools
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=1)
+def _get_model():
+    """Load the Basic Pitch model once per process."""
+    from basic_pitch import ICASSP_2022_MODEL_PATH
+    from basic_pitch.inference import Model
+
+    logger.info("Loading Basic Pitch model")
+    return Model(ICASSP_2022_MODEL_PATH)
+
+
 def analyze_pitch(audio_path: str, **kwargs) -> dict:
     """Detect polyphonic notes (MIDI events) in the audio.
 
     Returns a dict matching the PitchAnalysis Rust struct.
     """
+    import numpy as np
     from basic_pitch.inference import predict
 
     logger.info("Running pitch detection on %s", audio_path)
 
-    _, midi_data, _ = predict(audio_path)
+    _, midi_data, _ = predict(audio_path, model_or_model_path=_get_model())
 
-    notes = []
+    pitches, starts, ends, velocities = [], [], [], []
     for instrument in midi_data.instruments:
         for note in instrument.notes:
-            notes.append(
-                {
-                    "midi_note": note.pitch,
-                    "start": round(float(note.start), 4),
-                    "end": round(float(note.end), 4),
-                    "velocity": round(note.velocity / 127.0, 3),
-                }
-            )
-
-    # Sort by start time
-    notes.sort(key=lambda n: n["start"])
+            pitches.append(note.pitch)
+            starts.append(note.start)
+            ends.append(note.end)
+            velocities.append(note.velocity)
+
+    # Round each column in one pass rather than per note
+    pitches = np.asarray(pitches, dtype=np.int64)
+    starts = np.round(np.asarray(starts, dtype=np.float64), 4)
+    ends = np.round(np.asarray(ends, dtype=np.float64), 4)
+    velocities = np.round(np.asarray(velocities, dtype=np.float64) / 127.0, 3)
+
+    # Sort by start time (stable, so simultaneous notes keep their order)
+    order = np.argsort(starts, kind="stable")
+
+    notes = [
+        {"midi_note": pitch, "start": start, "end": end, "velocity": velocity}
+        for pitch, start, end, velocity in zip(
+            pitches[order].tolist(),
+            starts[order].tolist(),
+            ends[order].tolist(),
+            velocities[order].tolist(),
+        )
+    ]
 
     return {"notes": notes}
@@ -8,63 +8,84 @@ logger = logging.getLogger(__name__)
 def analyze_vocals(vocal_stem_path: str, **kwargs) -> dict:
     """Detect regions where vocals are present based on stem energy.
 
+    The stem is streamed from disk in ~30 s blocks, so memory use stays
+    constant regardless of its length.
+
     Returns a dict matching the VocalPresence Rust struct.
     """
     import librosa
     import numpy as np
+    import soundfile as sf
 
     logger.info("Running vocal presence detection on %s", vocal_stem_path)
 
-    y, sr = librosa.load(vocal_stem_path, sr=22050)
-    hop_length = 512
+    # RMS on a ~23 ms hop with ~93 ms frames, at the file's native rate.
+    # Frames are uncentered so consecutive blocks tile the same frame grid:
+    # each block overlaps the previous one by (frame_length - hop_length)
+    with sf.SoundFile(vocal_stem_path) as f:
+        sr = f.samplerate
+    hop_length = max(1, round(sr * 256 / 11025))
+    frame_length = 4 * hop_length
+    overlap = frame_length - hop_length
+    blocksize = hop_length * max(1, 30 * sr // hop_length) + overlap
+
+    rms_blocks = []
+    for block in sf.blocks(
+        vocal_stem_path,
+        blocksize=blocksize,
+        overlap=overlap,
+        dtype="float32",
+        always_2d=True,
+    ):
+        if len(block) < frame_length:
+            continue
+        y = block.mean(axis=1)
+        rms_blocks.append(
+            librosa.feature.rms(
+                y=y, frame_length=frame_length, hop_length=hop_length, center=False
+            )[0]
+        )
+    if not rms_blocks:
+        return {"segments": []}
 
-    # Compute RMS energy
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-    times = librosa.frames_to_time(range(len(rms)), sr=sr, hop_length=hop_length)
+    rms = np.concatenate(rms_blocks)
+    times = (np.arange(len(rms)) * hop_length + frame_length / 2) / sr
 
     # Dynamic threshold: use median + a fraction of the range
     rms_median = float(np.median(rms))
     rms_max = float(np.max(rms))
     threshold = rms_median + 0.15 * (rms_max - rms_median)
 
-    # Find segments where RMS exceeds threshold
-    segments = []
-    in_segment = False
-    seg_start = 0.0
-
-    for i, (t, r) in enumerate(zip(times, rms)):
-        if r > threshold and not in_segment:
-            in_segment = True
-            seg_start = float(t)
-        elif r <= threshold and in_segment:
-            in_segment = False
-            seg_end = float(t)
-            # Only keep segments longer than 0.3 seconds
-            if seg_end - seg_start > 0.3:
-                segments.append(
-                    {
-                        "start": round(seg_start, 3),
-                        "end": round(seg_end, 3),
-                    }
-                )
-
-    # Close final segment
-    if in_segment:
-        seg_end = float(times[-1]) if len(times) > 0 else 0.0
-        if seg_end - seg_start > 0.3:
-            segments.append(
-                {
-                    "start": round(seg_start, 3),
-                    "end": round(seg_end, 3),
-                }
-            )
+    # Find segments where RMS exceeds threshold: a segment starts on a
+    # rising edge of the mask and ends on the next falling edge (or on the
+    # last frame if still open)
+    above = rms > threshold
+    edges = np.diff(above.astype(np.int8))
+    start_frames = np.flatnonzero(edges == 1) + 1
+    end_frames = np.flatnonzero(edges == -1) + 1
+    if len(above) > 0 and above[0]:
+        start_frames = np.concatenate(([0], start_frames))
+    if len(above) > 0 and above[-1]:
+        end_frames = np.append(end_frames, len(above) - 1)
+
+    starts = times[start_frames]
+    ends = times[end_frames]
+
+    # Only keep segments longer than 0.3 seconds
+    keep = ends - starts > 0.3
+    starts = np.round(starts[keep], 3)
+    ends = np.round(ends[keep], 3)
 
     # Merge segments that are very close (< 0.5 seconds gap)
-    merged = []
-    for seg in segments:
-        if merged and seg["start"] - merged[-1]["end"] < 0.5:
-            merged[-1]["end"] = seg["end"]
-        else:
-            merged.append(seg)
+    if len(starts) > 0:
+        opens_group = np.concatenate(([True], starts[1:] - ends[:-1] >= 0.5))
+        closes_group = np.append(opens_group[1:], True)
+        starts = starts[opens_group]
+        ends = ends[closes_group]
+
+    merged = [
+        {"start": start, "end": end}
+        for start, end in zip(starts.tolist(), ends.tolist())
+    ]
 
     return {"segments": merged}
@@ -6,21 +6,36 @@ and provides audio analysis endpoints. Communication uses JSON over HTTP
 with SSE for progress streaming.
 
 Usage:
-    python sidecar.py --port 9123 --models-dir /path/to/models
+    python sidecar.py --port 9123 --models-dir /path/to/models [--workers N]
+    python sidecar.py --uds /tmp/vibelights.sock --models-dir /path/to/models
 """
 
 import argparse
 import asyncio
+import contextlib
+import hmac
 import logging
 import os
 import signal
 import sys
+import threading
 from pathlib import Path
 
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from sse_starlette.sse import EventSourceResponse
+import anyio
+import orjson
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, StrictBool
+from sse_starlette.sse import AppStatus, EventSourceResponse, ServerSentEvent
+from starlette.background import BackgroundTask
+
+from analyzers.pipeline import (
+    THREAD_ENV_VARS,
+    ModelCache,
+    create_process_pool,
+    run_pipeline,
+    warmup,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,88 +44,297 @@ logging.basicConfig(
 )
 logger = logging.getLogger("vibelights-sidecar")
 
-app = FastAPI(title="VibeLights Analysis Sidecar")
-
 # Global config set at startup
 _models_dir: Path = Path(".")
+_shutdown_token = None  # Required X-Shutdown-Token value, if configured
 _shutdown_event = asyncio.Event()
+_process_pool = None  # Analyzer process pool, owned by the app lifespan
+_models_cache = None  # (mtime_ns, names) of the last /models listing
+
+# Seconds the process gets to exit normally after the lifespan shuts down
+# before os._exit ends it (the app kills the sidecar 2 s after /shutdown)
+_HARD_EXIT_DELAY = 0.5
+
+# Analyses allowed to run at once; further requests wait for a slot
+_analyze_semaphore = asyncio.Semaphore(
+    int(os.environ.get("VIBELIGHTS_MAX_CONCURRENT", "2"))
+)
+
+# Models loaded by analyzers, kept warm between /analyze requests
+_model_cache = ModelCache(
+    max_models=int(os.environ.get("VIBELIGHTS_MAX_MODELS", "2"))
+)
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app: FastAPI):
+    global _process_pool
+    workers = max(1, int(os.environ.get("VIBELIGHTS_WORKERS", "1")))
+    # This server process's share of the cores, split across its pool workers
+    cpu_share = max(1, (os.cpu_count() or 1) // workers)
+    _process_pool = create_process_pool(
+        max_workers=min(4, cpu_share), cpu_budget=cpu_share
+    )
+    # Compile librosa's numba kernels in the background so the first
+    # analysis doesn't pay for it and /health answers immediately
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    try:
+        yield
+    finally:
+        # Stop idle workers now and drop queued work
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+        # Running analyzer threads and pool jobs can't be interrupted and
+        # would hold up interpreter exit until they return; only give them
+        # a short grace before exiting regardless
+        exit_timer = threading.Timer(_HARD_EXIT_DELAY, _hard_exit)
+        exit_timer.daemon = True
+        exit_timer.start()
+
+
+app = FastAPI(
+    title="VibeLights Analysis Sidecar",
+    default_response_class=ORJSONResponse,
+    lifespan=_lifespan,
+)
+
+
+class Features(BaseModel):
+    """Matches the AnalysisFeatures Rust struct."""
+
+    model_config = ConfigDict(extra="allow")
+
+    # Strict so that a non-boolean flag (e.g. "yes") is rejected with a 422
+    # instead of being coerced to True
+    beats: StrictBool = False
+    structure: StrictBool = False
+    stems: StrictBool = False
+    lyrics: StrictBool = False
+    mood: StrictBool = False
+    harmony: StrictBool = False
+    low_level: StrictBool = False
+    pitch: StrictBool = False
+    drums: StrictBool = False
+    vocal_presence: StrictBool = False
 
 
 class AnalyzeRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     audio_path: str
     output_dir: str
-    features: dict
+    features: Features
     models_dir: str
     gpu: bool = False
 
 
-class HealthResponse(BaseModel):
-    status: str = "ok"
-    version: str = "0.1.0"
+# Constant replies, encoded once. /health is polled, so its whole response
+# object is reused rather than validated and serialized per request
+_HEALTH_RESPONSE = Response(
+    orjson.dumps({"status": "ok", "version": "0.1.0"}),
+    media_type="application/json",
+)
+_SHUTTING_DOWN_BODY = orjson.dumps({"status": "shutting_down"})
+_ALREADY_SHUTTING_DOWN_BODY = orjson.dumps({"status": "already_shutting_down"})
+_QUEUED_PROGRESS = orjson.dumps(
+    {"phase": "Queued", "progress": 0.0, "detail": "Waiting for other analyses"}
+).decode()
 
 
 # ── Endpoints ──────────────────────────────────────────────────────
 
 
 @app.get("/health")
-async def health() -> HealthResponse:
-    return HealthResponse()
+async def health():
+    return _HEALTH_RESPONSE
 
 
 @app.post("/analyze")
-async def analyze(request: AnalyzeRequest):
+async def analyze(request: AnalyzeRequest, http_request: Request):
     """Run audio analysis with SSE progress streaming."""
+    # Reject bad paths before opening the stream and starting any analyzers
+    if not os.path.isfile(request.audio_path):
+        return ORJSONResponse(
+            {"error": f"Audio file not found: {request.audio_path}"},
+            status_code=400,
+        )
+    output_dir = os.path.realpath(request.output_dir)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except OSError as e:
+        return ORJSONResponse(
+            {"error": f"Cannot create output directory {output_dir}: {e}"},
+            status_code=400,
+        )
 
     async def event_generator():
-        from analyzers.pipeline import run_pipeline
-
         try:
-            async for event in run_pipeline(
-                audio_path=Path(request.audio_path),
-                output_dir=Path(request.output_dir),
-                features=request.features,
-                models_dir=Path(request.models_dir),
-                use_gpu=request.gpu,
-            ):
-                yield event
+            if _analyze_semaphore.locked():
+                yield ServerSentEvent(data=_QUEUED_PROGRESS, event="progress")
+            async with _analyze_semaphore:
+                in_flight = set()
+                try:
+                    # aclosing runs the pipeline's cleanup (cancelling pending
+                    # analyzers) as soon as we stop iterating, not at GC time
+                    async with contextlib.aclosing(
+                        run_pipeline(
+                            audio_path=request.audio_path,
+                            output_dir=output_dir,
+                            features=request.features.model_dump(),
+                            models_dir=request.models_dir,
+                            use_gpu=request.gpu,
+                            get_model=_model_cache.get,
+                            process_pool=_process_pool,
+                            in_flight=in_flight,
+                        )
+                    ) as events:
+                        async for event, data in events:
+                            # Stop once nobody listens
+                            if await http_request.is_disconnected():
+                                logger.info("Client disconnected, stopping analysis")
+                                break
+                            yield ServerSentEvent(data=data, event=event)
+                finally:
+                    await _wait_finished(in_flight)
         except Exception as e:
             logger.exception("Analysis failed")
-            yield {
-                "event": "error",
-                "data": f'{{"error": "{str(e)}"}}',
-            }
+            yield ServerSentEvent(
+                data=orjson.dumps({"error": str(e)}).decode(), event="error"
+            )
 
     return EventSourceResponse(event_generator())
 
 
+async def _wait_finished(futures: set):
+    """Wait for analyzer jobs that were already running when a run stopped.
+
+    Cancellation can't interrupt their threads or pool processes, so the
+    analysis slot is held until they return. Shielded, because a client
+    disconnect cancels the stream and would otherwise abort this wait.
+    """
+    running = [asyncio.wrap_future(future) for future in futures if not future.done()]
+    # When the server is exiting there is no slot to protect; don't hold it up
+    if running and not AppStatus.should_exit:
+        logger.info("Waiting for %d cancelled analyzer(s) to finish", len(running))
+        with anyio.CancelScope(shield=True):
+            await asyncio.wait(running)
+
+
 @app.get("/models")
 async def list_models():
-    """List installed model directories."""
-    models = []
-    if _models_dir.exists():
-        for entry in _models_dir.iterdir():
-            if entry.is_dir():
-                models.append(entry.name)
-    return {"models": models}
+    """List installed model directories.
+
+    The listing is cached until the models directory's mtime changes, which
+    happens whenever an entry is added, removed or renamed.
+    """
+    global _models_cache
+    try:
+        mtime = os.stat(_models_dir).st_mtime_ns
+        if _models_cache is None or _models_cache[0] != mtime:
+            # DirEntry.is_dir uses the directory listing's file type, so no
+            # extra stat per entry (except for symlinks, which are followed).
+            # Hidden directories (e.g. .numba_cache) are not models.
+            with os.scandir(_models_dir) as entries:
+                models = [
+                    entry.name
+                    for entry in entries
+                    if entry.is_dir() and not entry.name.startswith(".")
+                ]
+            _models_cache = (mtime, models)
+    except FileNotFoundError:
+        return {"models": []}
+    return {"models": _models_cache[1]}
+
+
+@app.post("/models/evict")
+async def evict_models(name: str = None):
+    """Unload cached models named `name` (e.g. "whisper"), or all of them."""
+    evicted = _model_cache.evict(name)
+    logger.info("Evicted %d model(s)", len(evicted))
+    return {"evicted": evicted}
 
 
 @app.post("/shutdown")
-async def shutdown():
-    """Graceful shutdown."""
+async def shutdown(x_shutdown_token: str = Header(None)):
+    """Graceful shutdown. Repeated requests don't schedule another exit."""
+    if _shutdown_token and not hmac.compare_digest(
+        (x_shutdown_token or "").encode(), _shutdown_token.encode()
+    ):
+        return ORJSONResponse({"error": "Invalid shutdown token"}, status_code=403)
+    if _shutdown_event.is_set():
+        return Response(_ALREADY_SHUTTING_DOWN_BODY, media_type="application/json")
+
     logger.info("Shutdown requested")
     _shutdown_event.set()
-    # Schedule actual shutdown after response is sent
-    asyncio.get_event_loop().call_later(0.5, _force_exit)
-    return {"status": "shutting_down"}
+    # Exit from a background task, which runs once the response is sent
+    return Response(
+        _SHUTTING_DOWN_BODY,
+        media_type="application/json",
+        background=BackgroundTask(_delayed_exit),
+    )
+
+
+async def _delayed_exit():
+    # Let the client read the response and close the connection first
+    await asyncio.sleep(0.1)
+    _force_exit()
 
 
 def _force_exit():
-    os.kill(os.getpid(), signal.SIGTERM)
+    server = getattr(app.state, "server", None)
+    if server is not None:
+        # Single process: ask uvicorn to stop directly, and end open SSE
+        # streams now rather than cancelling them at the graceful shutdown
+        # timeout (sse-starlette only does this itself on a signal)
+        AppStatus.should_exit = True
+        if AppStatus.should_exit_event is not None:
+            AppStatus.should_exit_event.set()
+        server.should_exit = True
+        return
+    # Stop the uvicorn supervisor rather than this worker, so that with
+    # several workers it shuts them all down instead of restarting this one
+    pid = int(os.environ.get("VIBELIGHTS_SIDECAR_PID", os.getpid()))
+    os.kill(pid, signal.SIGTERM)
+
+
+def _hard_exit():
+    """Exit now, without waiting for analyzer threads or pool jobs.
+
+    Pool workers exit on their own once this process is gone.
+    """
+    logging.shutdown()
+    os._exit(0)
+
+
+def create_app() -> FastAPI:
+    """App factory that uvicorn calls once in each worker process.
+
+    Workers are separate processes that re-import this module, so settings
+    are passed through the environment by main() rather than as globals.
+    """
+    global _models_dir, _shutdown_token
+    _models_dir = Path(os.environ.get("VIBELIGHTS_MODELS_DIR", "./models"))
+    _shutdown_token = os.environ.get("VIBELIGHTS_SHUTDOWN_TOKEN") or None
+    _models_dir.mkdir(parents=True, exist_ok=True)
+    # Persist numba's compiled kernels next to the models (the bundled
+    # package directory may not be writable). Must be set before numba loads.
+    os.environ.setdefault(
+        "NUMBA_CACHE_DIR", str((_models_dir / ".numba_cache").resolve())
+    )
+    return app
 
 
 # ── Main ───────────────────────────────────────────────────────────
 
 
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description="VibeLights Analysis Sidecar")
     parser.add_argument("--port", type=int, default=9100, help="Port to listen on")
@@ -120,23 +344,80 @@ def main():
         default="./models",
         help="Directory for ML model weights",
     )
+    parser.add_argument(
+        "--uds",
+        type=str,
+        default=None,
+        help="Listen on this Unix domain socket instead of the TCP port",
+    )
+    parser.add_argument(
+        "--shutdown-token",
+        type=str,
+        default=None,
+        help="Require this X-Shutdown-Token header on /shutdown "
+        "(or set VIBELIGHTS_SHUTDOWN_TOKEN, which other users can't see)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=_positive_int,
+        default=1,
+        help="Number of server processes (each loads its own models)",
+    )
     args = parser.parse_args()
 
-    global _models_dir
-    _models_dir = Path(args.models_dir)
-    _models_dir.mkdir(parents=True, exist_ok=True)
-
-    logger.info(f"Starting sidecar on port {args.port}")
-    logger.info(f"Models directory: {_models_dir}")
+    if args.uds and sys.platform == "win32":
+        logger.warning("--uds is not supported on Windows, using TCP instead")
+        args.uds = None
+
+    os.environ["VIBELIGHTS_MODELS_DIR"] = args.models_dir
+    os.environ["VIBELIGHTS_SIDECAR_PID"] = str(os.getpid())
+    os.environ["VIBELIGHTS_WORKERS"] = str(args.workers)
+    if args.workers > 1:
+        # Each worker would otherwise size its BLAS/OpenMP/numba pools to
+        # every core. Split the cores instead; workers inherit this before
+        # they import numpy (their analyzer pools split it further).
+        threads = str(max(1, (os.cpu_count() or 1) // args.workers))
+        for var in THREAD_ENV_VARS:
+            os.environ.setdefault(var, threads)
+    if args.shutdown_token:
+        os.environ["VIBELIGHTS_SHUTDOWN_TOKEN"] = args.shutdown_token
+
+    address = args.uds or f"port {args.port}"
+    logger.info(f"Starting sidecar on {address} ({args.workers} worker(s))")
+    logger.info(f"Models directory: {args.models_dir}")
 
     import uvicorn
 
-    uvicorn.run(
-        app,
-        host="127.0.0.1",
-        port=args.port,
-        log_level="warning",
-    )
+    # uvicorn picks uvloop and httptools automatically where installed
+    # (uvicorn[standard]); uvloop does not support Windows. Open SSE streams
+    # get 1 s to finish on shutdown instead of holding the process open.
+    # The only client is the app over loopback: skip per-request access
+    # logging, and keep its pooled connection open between polls.
+    server_options = {
+        "host": "127.0.0.1",
+        "port": args.port,
+        "log_level": "warning",
+        "access_log": False,
+        "timeout_keep_alive": 75,
+        "h11_max_incomplete_event_size": 16 * 1024,
+        "timeout_graceful_shutdown": 1,
+    }
+    if args.uds:
+        # Same-host IPC without the TCP stack; host and port are ignored
+        server_options["uds"] = args.uds
+
+    if args.workers > 1:
+        uvicorn.run(
+            "sidecar:create_app",
+            factory=True,
+            workers=args.workers,
+            **server_options,
+        )
+        return
+
+    server = uvicorn.Server(uvicorn.Config(create_app(), **server_options))
+    app.state.server = server
+    server.run()
 
 
 if __name__ == "__main__":